@@ -1,18 +1,25 @@
 #!/usr/bin/env python3
 
 import argparse
+import certifi
 import logging
+import math
+import orjson
 import os
-import requests
-import schedule
+import select
 import signal
+import socket
+import threading
 import time
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from influxdb_client import InfluxDBClient, Point, BucketRetentionRules
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import InfluxDBClient, BucketRetentionRules
+from influxdb_client.client.write_api import WriteOptions
 from influxdb_client.domain.write_precision import WritePrecision
-from itertools import zip_longest
+from itertools import repeat
 from urllib.parse import urljoin, urlencode, urlparse, urlunparse
+from urllib.request import getproxies, proxy_bypass
 
 
 DEFAULT_INTERVAL_SECONDS = 60
@@ -31,8 +38,89 @@ DEFAULT_INFLUXDB_BUCKET = 'pihole'
 DEFAULT_INFLUXDB_CREATE_BUCKET = False
 DEFAULT_INFLUXDB_VERIFY_SSL = True
 
+# Writes are buffered and sent to InfluxDB in the background once either limit is reached. Each polling cycle is
+# queued as a single record, so in practice the batches are flushed by the interval.
+INFLUXDB_BATCH_SIZE = 5000
+INFLUXDB_FLUSH_INTERVAL_MS = 1_000
+# Random delay added to each flush so that multiple exporters writing to the same InfluxDB do not flush in lockstep
+INFLUXDB_JITTER_INTERVAL_MS = 200
+# Delay before retrying a failed write (increased exponentially for subsequent attempts)
+INFLUXDB_RETRY_INTERVAL_MS = 5_000
+# All timestamps are written with second precision, the coarsest that the Pi-hole data needs
+INFLUXDB_WRITE_PRECISION = WritePrecision.S
+
 DEBUG = False
 
+# Monotonic time at which a termination signal was first received, used to stop the polling loop. This is a plain
+# value rather than a threading.Event, as setting an Event from the signal handler could deadlock on its internal lock.
+stop_requested_at = None
+# A repeated termination signal only forces an immediate exit once this long has passed since the first, so that the
+# same stop request delivered more than once (e.g. to both the process and its process group) does not skip the flush
+STOP_FORCE_GRACE_SECONDS = 2
+
+# Reply types reported by Pi-hole, and the corresponding keys in the summary statistics
+REPLY_TYPES = ('UNKNOWN', 'NODATA', 'NXDOMAIN', 'CNAME', 'IP', 'DOMAIN', 'RRNAME', 'SERVFAIL', 'REFUSED', 'NOTIMP', 'OTHER', 'DNSSEC', 'NONE', 'BLOB')
+REPLY_STAT_KEYS = tuple(f'reply_{reply_type}' for reply_type in REPLY_TYPES)
+# The replies measurement has a fixed schema of integer counts, so its field set is formatted directly
+REPLIES_FIELD_SET_FORMAT = ','.join(f'{reply_type}=%di' for reply_type in REPLY_TYPES)
+
+# Formats a (key, value) pair as "key:value" for the table data stored as CSV
+CSV_PAIR_FORMAT = '%s:%s'.__mod__
+
+# Characters which must be escaped in InfluxDB line protocol tag keys, tag values, and field keys
+LINE_PROTOCOL_KEY_ESCAPES = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r'
+})
+# Characters which must be escaped in InfluxDB line protocol string field values
+LINE_PROTOCOL_STRING_ESCAPES = str.maketrans({
+    '"': r'\"',
+    '\\': r'\\'
+})
+
+'''
+Escape a tag key or field key for use in InfluxDB line protocol.
+'''
+def escape_key(key):
+    return str(key).translate(LINE_PROTOCOL_KEY_ESCAPES)
+
+'''
+Escape a tag value for use in InfluxDB line protocol.
+'''
+def escape_tag_value(value):
+    escaped = escape_key(value)
+    # A trailing backslash would otherwise escape the delimiter which follows
+    return escaped + ' ' if escaped.endswith('\\') else escaped
+
+'''
+Format a set of tags as the tag portion of an InfluxDB line protocol entry (e.g. ",alias=pihole,hostname=pi.hole").
+Tags without a value are omitted.
+'''
+def format_tags(tags):
+    return ''.join([f',{escape_key(key)}={escape_tag_value(value)}' for key, value in tags.items() if value])
+
+'''
+Format a field value for InfluxDB line protocol, returning None if the value cannot be represented.
+'''
+def format_field_value(value):
+    # bool is a subclass of int, so it must be checked first
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, int):
+        return f'{value}i'
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        formatted = repr(value)
+        return formatted[:-2] if formatted.endswith('.0') else formatted
+    if isinstance(value, str):
+        return f'"{value.translate(LINE_PROTOCOL_STRING_ESCAPES)}"'
+    return None
+
 '''
 Class to contain a Pi-hole configuration.
 '''
@@ -41,7 +129,16 @@ class Pihole():
     def __init__(self, alias, address, token=None):
         self.alias = alias
         self.address = address
+        self.hostname = urlparse(address).hostname
+        self.api_url = f'{address}/admin/api.php'
+        # Tags written with every point for the instance, pre-formatted for InfluxDB line protocol
+        self.line_protocol_tags = format_tags({
+            "alias": alias,
+            "hostname": self.hostname
+        })
         self.token = token
+        # Held while the instance is being polled, so that only one poll is ever in flight at a time
+        self.lock = threading.Lock()
 
 '''
 Class to contain the application configuration.
@@ -62,8 +159,10 @@ class Config():
             exit(1)
         pihole_tokens = (args.pihole_token or os.getenv("PIHOLE_TOKEN", DEFAULT_PIHOLE_TOKEN))
         pihole_tokens = pihole_tokens.split(',') if pihole_tokens else list()
+        # Tokens are optional, so pad them out to one per Pi-hole
+        pihole_tokens = pihole_tokens + [None] * (len(pihole_addresses) - len(pihole_tokens))
         self.piholes = dict()
-        for alias,address,token in zip_longest(pihole_aliases, pihole_addresses, pihole_tokens):
+        for alias,address,token in zip(pihole_aliases, pihole_addresses, pihole_tokens):
             if address in self.piholes:
                 logging.warning(f'Duplicate Pi-hole address provided ({address}), skipping...')
                 continue
@@ -87,8 +186,10 @@ class Config():
     '''
     def dump(self):
         logging.info('================== Configuration ==================')
-        logging.info(f'Pi-holes:            {list(self.piholes.values())[0].alias} {list(self.piholes.values())[0].address} ' + ('(Auth token provided)' if list(self.piholes.values())[0].token else '(No auth token)'))
-        for pihole in list(self.piholes.values())[1:]:
+        piholes = iter(self.piholes.values())
+        first = next(piholes)
+        logging.info(f'Pi-holes:            {first.alias} {first.address} ' + ('(Auth token provided)' if first.token else '(No auth token)'))
+        for pihole in piholes:
             logging.info(f'                     {pihole.alias} {pihole.address} ' + ('(Auth token provided)' if pihole.token else '(No auth token)'))
         logging.info(f'Poll interval:       {self.interval_seconds} seconds')
         logging.info(f'InfluxDB address:    {self.influxdb_address}')
@@ -103,14 +204,61 @@ class PiholeInfluxDB():
 
     def __init__(self, config):
         self.config = config
+        # The statistics URL only depends on the configuration, so build it once for each instance. All of the data is
+        # requested in a single query so that each instance is polled with one request.
+        queries = ["summaryRaw", f'topItems={config.num_top_items}', f'topClients={config.num_top_clients}', "getForwardDestinations", "getQueryTypes", "overTimeData10mins"]
+        stats_query = "&".join(queries)
+        self._stats_urls = {address: self._get_pihole_api_url(pihole, stats_query, pihole.token) for address, pihole in config.piholes.items()}
+        # Set the request timeout to be either 50% of the polling interval, or 30 seconds, whichever is smaller.
+        self._request_timeout = min(0.5 * config.interval_seconds, 30)
+        # Keep connections to the instances alive between polling cycles rather than opening a new connection (and TLS
+        # session) for every request. A failed request is not retried, as the instance is polled again next cycle.
+        retries = urllib3.Retry(total=None, connect=0, read=False, other=0, redirect=5)
+        pool_kwargs = dict(num_pools=len(config.piholes), maxsize=1, timeout=urllib3.Timeout(total=self._request_timeout), retries=retries, ca_certs=certifi.where())
+        # Honour the standard proxy environment variables (e.g. HTTP_PROXY, HTTPS_PROXY and NO_PROXY) for each instance.
+        # Instances sharing a proxy (or not using one) share a pool manager.
+        proxies = getproxies()
+        pool_managers = {}
+        self._http = {}
+        for address, pihole in config.piholes.items():
+            proxy = proxies.get(urlparse(address).scheme)
+            if proxy and proxy_bypass(pihole.hostname):
+                proxy = None
+            if proxy and '://' not in proxy:
+                proxy = f'http://{proxy}'
+            if proxy not in pool_managers:
+                pool_managers[proxy] = urllib3.ProxyManager(proxy, **pool_kwargs) if proxy else urllib3.PoolManager(**pool_kwargs)
+            self._http[address] = pool_managers[proxy]
+        # Shared pool used to poll the Pi-hole instances concurrently
+        self._executor = ThreadPoolExecutor(max_workers=len(config.piholes), thread_name_prefix='pihole-poll')
+        # Long-lived InfluxDB client so that the connection pool is reused across polling cycles
+        self._influxdb_client = InfluxDBClient(url=config.influxdb_address, token=config.influxdb_token, org=config.influxdb_org, verify_ssl=config.influxdb_verify_ssl)
+        # Batching write API so that writes happen in the background instead of blocking the polling cycle
+        write_options = WriteOptions(batch_size=INFLUXDB_BATCH_SIZE, flush_interval=INFLUXDB_FLUSH_INTERVAL_MS, jitter_interval=INFLUXDB_JITTER_INTERVAL_MS, retry_interval=INFLUXDB_RETRY_INTERVAL_MS)
+        self._write_api = self._influxdb_client.write_api(write_options=write_options, success_callback=self._on_write_success, error_callback=self._on_write_error, retry_callback=self._on_write_retry)
+        self._bucket_verified = False
 
     '''
-    Ensure that the target InfluxDB bucket exists, creating it if necessary.
+    Flush any points still buffered for InfluxDB and release the InfluxDB client and Pi-hole connections. Any polling
+    cycle must already have completed.
+    '''
+    def close(self):
+        self._executor.shutdown()
+        # Closing the write API flushes the pending points, so it must happen before the client is closed
+        self._write_api.close()
+        self._influxdb_client.close()
+        for http in set(self._http.values()):
+            http.clear()
+
+    '''
+    Ensure that the target InfluxDB bucket exists, creating it if necessary. The check is only performed until it
+    first succeeds.
     '''
     def _verify_bucket(self):
-        influxdb_client = InfluxDBClient(url=self.config.influxdb_address, token=self.config.influxdb_token, org=self.config.influxdb_org, verify_ssl=self.config.influxdb_verify_ssl)
+        if self._bucket_verified:
+            return True
         try:
-            buckets_api = influxdb_client.buckets_api()
+            buckets_api = self._influxdb_client.buckets_api()
             if buckets_api.find_bucket_by_name(self.config.influxdb_bucket) is None:
                 if self.config.influxdb_create_bucket:
                     logging.info(f'InfluxDB bucket does not yet exist - creating...')
@@ -122,235 +270,160 @@ class PiholeInfluxDB():
         except Exception as e:
             logging.error(f'Error creating InfluxDB bucket: {str(e)}')
             return False
+        self._bucket_verified = True
         return True
 
     '''
-    Execute a GET request against the Pi-hole API.
+    Execute a GET request against the Pi-hole API, returning the decoded response body.
     '''
-    def _pihole_api_get(self, pihole, query=None, auth_token=None):
-        url = self._get_pihole_api_url(pihole, query, auth_token)
+    def _pihole_api_get(self, pihole, url):
         try:
-            # Set the request timeout to be either 50% of the polling interval, or 30 seconds, whichever is smaller.
-            response = requests.get(url, timeout=min(0.5 * self.config.interval_seconds, 30))
-            response.raise_for_status()
-            return response
-        except requests.exceptions.HTTPError as e:
-            logging.error(f'[{pihole.alias}] [HTTP {response.status_code}] Error executing request to {url}: {e}')
-        except requests.exceptions.ConnectionError as e:
-            logging.error(f'[{pihole.alias}] Error connecting to {pihole.address}: {e}')
-        except requests.exceptions.Timeout as e:
+            response = self._http[pihole.address].request('GET', url)
+            if response.status >= 400:
+                logging.error(f'[{pihole.alias}] [HTTP {response.status}] Error executing request to {url}: {response.reason}')
+                return None
+            data = orjson.loads(response.data)
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug(data)
+            return data
+        except urllib3.exceptions.MaxRetryError as e:
+            # Connection errors are not retried, so the underlying error is reported. Note that NewConnectionError is a
+            # subclass of ConnectTimeoutError, even when the connection was refused rather than timed out.
+            if isinstance(e.reason, urllib3.exceptions.TimeoutError) and not isinstance(e.reason, urllib3.exceptions.NewConnectionError):
+                logging.error(f'[{pihole.alias}] Timeout connecting to {pihole.address}: {e.reason}')
+            else:
+                logging.error(f'[{pihole.alias}] Error connecting to {pihole.address}: {e.reason}')
+        except urllib3.exceptions.TimeoutError as e:
             logging.error(f'[{pihole.alias}] Timeout connecting to {pihole.address}: {e}')
-        except requests.exceptions.RequestException as e:
+        except urllib3.exceptions.ProtocolError as e:
+            logging.error(f'[{pihole.alias}] Error connecting to {pihole.address}: {e}')
+        except urllib3.exceptions.HTTPError as e:
             logging.error(f'[{pihole.alias}] Unexpected error while sending request to {url}: {e}')
+        except orjson.JSONDecodeError as e:
+            logging.error(f'[{pihole.alias}] Invalid response from {url}: {e}')
         return None
 
     '''
     Get the URL for the Pi-hole API with an optional query element.
     '''
     def _get_pihole_api_url(self, pihole, query=None, auth_token=None):
-        url = f'{pihole.address}/admin/api.php'
-        query_data = list()
-        if query:
-            query_data.append(query)
         if auth_token:
-            query_data.append(f'auth={auth_token}')
-        if len(query_data) > 0:
-            url = f'{url}?{"&".join(query_data)}'
-        return url
+            query = f'{query}&auth={auth_token}' if query else f'auth={auth_token}'
+        return f'{pihole.api_url}?{query}' if query else pihole.api_url
 
     '''
-    Gets general Pi-hole statistics for the instance.
+    Gets general Pi-hole statistics for the instance, along with the number of blocked and total domains in 10 minute
+    intervals over the past 24 hours.
     '''
     def _get_stats(self, pihole):
-        queries = ["summaryRaw", f'topItems={self.config.num_top_items}', f'topClients={self.config.num_top_clients}', "getForwardDestinations", "getQueryTypes"]
-        response = self._pihole_api_get(pihole, "&".join(queries), pihole.token)
-        if response:
-            logging.debug(response.json())
-            return response.json()
-        return None
-
-    '''
-    Gets the number of blocked and total domains in 10 minute intervals over the past 24 hours for the instance.
-    '''
-    def _get_10min_data(self, pihole):
-        response = self._pihole_api_get(pihole, "overTimeData10mins", pihole.token)
-        if response:
-            logging.debug(response.json())
-            data = response.json()
-            if data == []:
-                logging.warning('No data in response')
-                return None, None
-            return dict(data['domains_over_time']), dict(data['ads_over_time'])
-        return None, None
+        data = self._pihole_api_get(pihole, self._stats_urls[pihole.address])
+        if data is not None:
+            if not data or 'domains_over_time' not in data or 'ads_over_time' not in data:
+                logging.warning(f'[{pihole.alias}] No data in response')
+                return None, None, None
+            # The over-time series are keyed by timestamp strings; normalize them once here rather than per point. An empty
+            # series is encoded by the API as an empty list rather than an object.
+            domains_over_time = {int(timestamp): int(count) for timestamp, count in dict(data.pop('domains_over_time')).items()}
+            ads_over_time = {int(timestamp): int(count) for timestamp, count in dict(data.pop('ads_over_time')).items()}
+            return data, domains_over_time, ads_over_time
+        return None, None, None
 
     '''
-    Write all data gathered to InfluxDB.
+    Convert all data gathered for a Pi-hole into InfluxDB points.
     '''
-    def _write_to_influxdb(self, pihole, stats, domains_over_time, ads_over_time):
-        now_seconds = int(time.time())
-        hostname = urlparse(pihole.address).hostname
-        tags = {
-            "alias": pihole.alias,
-            "hostname": hostname
-        }
+    def _prepare_points(self, pihole, stats, domains_over_time, ads_over_time, now_seconds):
+        tags = pihole.line_protocol_tags
         points=[]
 
         # Gravity
         gravity = stats.pop("gravity_last_updated")
-        points.append(Point.from_dict(
-            {
-                "measurement": "gravity",
-                "tags": tags,
-                "fields": {
-                    "file_exists": gravity['file_exists'],
-                    "last_updated": gravity['absolute'],
-                    "seconds_since_update": (gravity['relative']['days'] * 86400) + (gravity['relative']['hours'] * 3600) + (gravity['relative']['minutes'] * 60)
-                },
-                "time": now_seconds
-            },
-            WritePrecision.S
-        ))
+        self._prepare_point(points, "gravity", tags, {
+            "file_exists": gravity['file_exists'],
+            "last_updated": gravity['absolute'],
+            "seconds_since_update": (gravity['relative']['days'] * 86400) + (gravity['relative']['hours'] * 3600) + (gravity['relative']['minutes'] * 60)
+        }, now_seconds)
 
         # Replies
-        replies = {
-            'UNKNOWN': stats.pop("reply_UNKNOWN"),
-            'NODATA': stats.pop("reply_NODATA"),
-            'NXDOMAIN': stats.pop("reply_NXDOMAIN"),
-            'CNAME': stats.pop("reply_CNAME"),
-            'IP': stats.pop("reply_IP"),
-            'DOMAIN': stats.pop("reply_DOMAIN"),
-            'RRNAME': stats.pop("reply_RRNAME"),
-            'SERVFAIL': stats.pop("reply_SERVFAIL"),
-            'REFUSED': stats.pop("reply_REFUSED"),
-            'NOTIMP': stats.pop("reply_NOTIMP"),
-            'OTHER': stats.pop("reply_OTHER"),
-            'DNSSEC': stats.pop("reply_DNSSEC"),
-            'NONE': stats.pop("reply_NONE"),
-            'BLOB': stats.pop("reply_BLOB")
-        }
-        points.append(Point.from_dict(
-            {
-                "measurement": "replies",
-                "tags": tags,
-                "fields": replies,
-                "time": now_seconds
-            },
-            WritePrecision.S
-        ))
+        replies = REPLIES_FIELD_SET_FORMAT % tuple(map(stats.pop, REPLY_STAT_KEYS))
+        points.append(f'replies{tags} {replies} {now_seconds}')
 
         # Check for stats that required authentication
         if 'top_queries' in stats:
-            points.append(Point.from_dict(
-                {
-                    "measurement": "top_queries",
-                    "tags": tags,
-                    "fields": {
-                        "top_10": self._json_to_csv(stats.pop('top_queries'))
-                    },
-                    "time": now_seconds
-                },
-                WritePrecision.S
-            ))
+            self._prepare_point(points, "top_queries", tags, {"top_10": self._json_to_csv(stats.pop('top_queries'))}, now_seconds)
         if 'top_ads' in stats:
-            points.append(Point.from_dict(
-                {
-                    "measurement": "top_ads",
-                    "tags": tags,
-                    "fields": {
-                        "top_10": self._json_to_csv(stats.pop('top_ads'))   
-                    },
-                    "time": now_seconds
-                },
-                WritePrecision.S
-            ))
+            self._prepare_point(points, "top_ads", tags, {"top_10": self._json_to_csv(stats.pop('top_ads'))}, now_seconds)
         if 'top_sources' in stats:
-            points.append(Point.from_dict(
-                {
-                    "measurement": "top_sources",
-                    "tags": tags,
-                    "fields": {
-                        "top_10": self._json_to_csv(stats.pop('top_sources'))   
-                    },
-                    "time": now_seconds
-                },
-                WritePrecision.S
-            ))
+            self._prepare_point(points, "top_sources", tags, {"top_10": self._json_to_csv(stats.pop('top_sources'))}, now_seconds)
         if 'forward_destinations' in stats:
-            forward_destinations = stats.pop('forward_destinations')
-            points.append(Point.from_dict(
-                {
-                    "measurement": "forward_destinations",
-                    "tags": tags,
-                    "fields": forward_destinations,
-                    "time": now_seconds
-                },
-                WritePrecision.S,
-                field_types={x: "float" for x in forward_destinations}
-            ))
+            self._prepare_point(points, "forward_destinations", tags, stats.pop('forward_destinations'), now_seconds, coerce=float)
         if 'querytypes' in stats:
-            querytypes = stats.pop('querytypes')
-            points.append(Point.from_dict(
-                {
-                    "measurement": "query_types",
-                    "tags": tags,
-                    "fields": querytypes,
-                    "time": now_seconds
-                },
-                WritePrecision.S,
-                field_types={x: "float" for x in querytypes}
-            ))
+            self._prepare_point(points, "query_types", tags, stats.pop('querytypes'), now_seconds, coerce=float)
 
         # Remaining stats
         stats['ads_percentage_today'] = float(stats['ads_percentage_today']) # Ensure this is always a float, even when 0
         stats['status'] = 1 if stats['status'] == "enabled" else 0
-        points.append(Point.from_dict(
-            {
-                "measurement": "stats",
-                "tags": tags,
-                "fields": stats,
-                "time": now_seconds
-            },
-            WritePrecision.S
-        ))
-
-        # Domains over time
-        for timestamp,count in domains_over_time.items():
-            points.append(Point.from_dict(
-                {
-                    "measurement": "over_time_data",
-                    "tags": tags,
-                    "fields": {
-                        "domains_over_time": count
-                    },
-                    "time": int(timestamp)
-                },
-                WritePrecision.S
-            ))
-        
-        # Ads over time
-        for timestamp,count in ads_over_time.items():
-            points.append(Point.from_dict(
-                {
-                    "measurement": "over_time_data",
-                    "tags": tags,
-                    "fields": {
-                        "ads_over_time": count
-                    },
-                    "time": int(timestamp)
-                },
-                WritePrecision.S
-            ))
-        
-        # Batch write of points
-        influxdb_client = InfluxDBClient(url=self.config.influxdb_address, token=self.config.influxdb_token, org=self.config.influxdb_org, verify_ssl=self.config.influxdb_verify_ssl)
+        self._prepare_point(points, "stats", tags, stats, now_seconds)
+
+        # Domains over time and ads over time (one point per 10 minute interval over the past 24 hours). These are the bulk
+        # of the points, so the line protocol is built directly from a shared prefix rather than via _prepare_point. Both
+        # series cover the same intervals, so each interval is written as a single point with both fields.
+        series = f'over_time_data{tags} domains_over_time='
+        points.extend([f'{series}{count}i,ads_over_time={ads_over_time[timestamp]}i {timestamp}' for timestamp, count in domains_over_time.items() if timestamp in ads_over_time])
+        # Any interval only present in one of the series is written with just that field
+        for timestamp in domains_over_time.keys() ^ ads_over_time.keys():
+            self._prepare_point(points, "over_time_data", tags, {"domains_over_time": domains_over_time.get(timestamp), "ads_over_time": ads_over_time.get(timestamp)}, timestamp)
+
+        return points
+
+    '''
+    Serialize a single InfluxDB point to line protocol and add it to the list of points. The measurement name is used
+    as-is, and the tags must already be formatted (see format_tags). If provided, the coerce function is applied to
+    each field value to fix its type (e.g. float, to avoid field type conflicts for values which may be reported as
+    whole numbers).
+    '''
+    def _prepare_point(self, points, measurement, tags, fields, timestamp, coerce=None):
+        field_set = []
+        for key, value in fields.items():
+            if value is None:
+                continue
+            formatted = format_field_value(coerce(value) if coerce else value)
+            if formatted is not None:
+                field_set.append(f'{escape_key(key)}={formatted}')
+        # A point must have at least one field
+        if field_set:
+            points.append(f'{measurement}{tags} {",".join(field_set)} {timestamp}')
+
+    '''
+    Queue a batch of points to be written to InfluxDB.
+    '''
+    def _write_points_to_influxdb(self, points):
         try:
-            with influxdb_client.write_api(write_options=SYNCHRONOUS) as write_api:
-                write_api.write(self.config.influxdb_bucket, self.config.influxdb_org, record=points)
+            # Queue the points as a single line protocol record, rather than the write API handling each point separately
+            record = '\n'.join(points).encode()
+            self._write_api.write(self.config.influxdb_bucket, self.config.influxdb_org, record=record, write_precision=INFLUXDB_WRITE_PRECISION)
         except Exception as e:
             logging.error(f'Error writing data to InfluxDB: {str(e)}')
             return False
         return True
 
+    '''
+    Callback for when a batch of points has been written to InfluxDB.
+    '''
+    def _on_write_success(self, conf, data):
+        logging.info(f'Wrote batch to InfluxDB successfully ({len(data)} bytes)')
+
+    '''
+    Callback for when a batch of points could not be written to InfluxDB.
+    '''
+    def _on_write_error(self, conf, data, exception):
+        logging.error(f'Error writing data to InfluxDB: {str(exception)}')
+
+    '''
+    Callback for when writing a batch of points to InfluxDB failed and will be retried.
+    '''
+    def _on_write_retry(self, conf, data, exception):
+        logging.warning(f'Retrying write to InfluxDB: {str(exception)}')
+
     '''
     Utility function to take a JSON object and convert the fields to a comma-separated list of key-value pairs.
     For example: {'example.com': 123, 'google.com': 456}
@@ -360,48 +433,121 @@ class PiholeInfluxDB():
     It's simpler to store the data as CSV, then apply transformations in a tool such as Grafana for display purposes.
     '''
     def _json_to_csv(self, data):
-        return ','.join([f'{key}:{value}' for key, value in dict(data).items()])
+        return ','.join(map(CSV_PAIR_FORMAT, dict(data).items()))
 
     '''
-    Runs the scheduled polling job for a single Pi-hole.
+    Runs the polling job for a single Pi-hole, returning the points to write to InfluxDB.
     '''
-    def _run_job(self, pihole):
+    def _run_job(self, pihole, now_seconds):
+        # Skip the instance if the poll from the previous cycle has not yet completed
+        if not pihole.lock.acquire(blocking=False):
+            logging.warning(f'[{pihole.alias}] Previous poll still in progress, skipping...')
+            return []
+        try:
+            return self._poll(pihole, now_seconds)
+        except Exception:
+            # Contain the failure to this instance so that the points gathered from the others are still written
+            logging.exception(f'[{pihole.alias}] Unexpected error while polling')
+            return []
+        finally:
+            pihole.lock.release()
+
+    '''
+    Queries a single Pi-hole, returning the points to write to InfluxDB.
+    '''
+    def _poll(self, pihole, now_seconds):
         query_start = datetime.now()
-        stats = self._get_stats(pihole)
-        domains_over_time, ads_over_time = self._get_10min_data(pihole)
+        stats, domains_over_time, ads_over_time = self._get_stats(pihole)
         query_end = datetime.now()
         if stats and domains_over_time and ads_over_time:
             logging.info(f'[{pihole.alias}] Queried successfully in {int((query_end - query_start).total_seconds() * 1000)}ms')
-            write_start = datetime.now()
-            if self._write_to_influxdb(pihole, stats, domains_over_time, ads_over_time):
-                write_end = datetime.now()
-                logging.info(f'[{pihole.alias}] Wrote to InfluxDB successfully in {int((write_end - write_start).total_seconds() * 1000)}ms')
+            return self._prepare_points(pihole, stats, domains_over_time, ads_over_time, now_seconds)
+        return []
+
+    '''
+    Runs the scheduled polling cycle, writing the points gathered from every Pi-hole instance to InfluxDB in a single
+    batch.
+    '''
+    def _run_cycle(self):
+        # Timestamp shared by the point-in-time measurements of every instance in this cycle
+        now_seconds = int(time.time())
+        points = []
+        # Poll the instances concurrently so that a slow instance does not hold up the others
+        for pihole_points in self._executor.map(self._run_job, self.config.piholes.values(), repeat(now_seconds)):
+            points.extend(pihole_points)
+        if not points:
+            return
+        if self._write_points_to_influxdb(points):
+            logging.debug(f'Queued {len(points)} points for writing to InfluxDB')
         return
 
     '''
-    Starts the scheduled polling jobs for each Pi-hole instance.
+    Starts the scheduled polling cycle for the Pi-hole instances.
     '''
     def start(self):
         logging.info('Starting...')
         # Ensure the target bucket exists
         if not self._verify_bucket():
             exit(1)
-        # Schedule one job per Pi-hole instance to monitor
-        for pihole in self.config.piholes.values():
-            job = schedule.every(self.config.interval_seconds).seconds.do(self._run_job, pihole=pihole)
-            job.run() # Run immediately without initial delay
-        # Run until stopped
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        # Run a cycle which polls every Pi-hole instance and writes the results together immediately, then once per
+        # interval, sleeping in between. Each cycle runs in its own thread so that a slow cycle does not delay the next.
+        # Cycles are scheduled against a monotonic deadline so that the interval does not drift over time. If the
+        # deadline has already passed (e.g. after the host was suspended), the missed cycles are skipped.
+        # Signals also write to a wakeup socket, so that the loop can sleep until the next deadline and still be woken
+        # as soon as it is asked to stop.
+        wakeup_reader, wakeup_writer = socket.socketpair()
+        wakeup_reader.setblocking(False)
+        wakeup_writer.setblocking(False)
+        signal.set_wakeup_fd(wakeup_writer.fileno(), warn_on_full_buffer=False)
+        deadline = time.monotonic()
+        cycles = []
+        try:
+            while True:
+                cycles = [cycle for cycle in cycles if cycle.is_alive()]
+                cycles.append(run_threaded(self._run_cycle))
+                now = time.monotonic()
+                deadline = max(deadline + self.config.interval_seconds, now)
+                while stop_requested_at is None and now < deadline:
+                    if select.select([wakeup_reader], [], [], deadline - now)[0]:
+                        wakeup_reader.recv(4096)
+                    now = time.monotonic()
+                if stop_requested_at is not None:
+                    break
+        finally:
+            signal.set_wakeup_fd(-1)
+            wakeup_reader.close()
+            wakeup_writer.close()
+            # Let any cycle still in progress finish (the requests are bounded by the request timeout), so that its
+            # points are queued before the write API is closed and flushed
+            for cycle in cycles:
+                cycle.join()
+            self.close()
+
+'''
+Runs a job in a background thread rather than on the main thread, returning the thread.
+'''
+def run_threaded(job_func, **kwargs):
+    thread = threading.Thread(target=job_func, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
 
 '''
 Handler for SIGTERM and SIGINT signals.
 '''
 def signal_handler(signum, frame):
+    global stop_requested_at
     if signum in [signal.SIGTERM, signal.SIGINT]:
-        logging.info('Stopping...')
-        exit(0)
+        # Rather than exiting from within the handler, stop the polling loop so that the in-progress cycle can finish
+        # and any points still buffered for InfluxDB are flushed. Flushing may block for a long time while InfluxDB is
+        # unreachable, so a signal repeated after the grace period exits immediately, discarding the buffered points.
+        now = time.monotonic()
+        if stop_requested_at is None:
+            logging.info('Stopping...')
+            stop_requested_at = now
+        elif now - stop_requested_at >= STOP_FORCE_GRACE_SECONDS:
+            logging.warning('Stopping immediately, discarding any points not yet written to InfluxDB')
+            os._exit(1)
+        return
     exit(1)
 
 def main():